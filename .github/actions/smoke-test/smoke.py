@@ -23,19 +23,38 @@ Destination in the built container
 └── test/
     ├── test.sh
     └── test-utils.sh
+
+================================
+Build cache
+================================
+
+Set SMOKE_CACHE_FROM and/or SMOKE_CACHE_TO to buildx cache specs (for example
+type=gha or type=local,src=/tmp/bkcache / type=local,dest=/tmp/bkcache,mode=max)
+to reuse image layers across runs. A docker-container buildx builder is created
+for this, since the default docker driver cannot export cache. type=gha also
+needs ACTIONS_RUNTIME_TOKEN and ACTIONS_RESULTS_URL (cache service v2) in the
+environment; the smoke-test action exports them when a type=gha input is set.
 """
 
 from __future__ import annotations
 
 import argparse
+import fcntl
+import functools
 import json
+import mmap
 import os
+import re
+import shlex
 import shutil
 import subprocess
 import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from pathlib import Path
 import logging
-from typing import Optional
+from typing import Iterator, Optional
 
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
@@ -47,6 +66,29 @@ SMOKE_UTILS_DIRECTORY = "utils"
 SMOKE_FILE = "test.sh"
 SMOKE_UTILS_FILE = "test-utils.sh"
 SMOKE_LABEL = "test-container"
+SMOKE_CONTAINER_ID_FILE = ".smoke_cid"
+DEVCONTAINERS_CLI_LOCK = "devcli.lock"
+BUILDX_BUILDER = "smoke"
+BUILDX_BUILDER_LOCK = "buildx.lock"
+MAX_CONTAINER_REMOVALS = 8
+# Files that never carry template placeholders and are not worth reading
+SKIP_SUFFIXES = frozenset(
+    {
+        ".png",
+        ".jpg",
+        ".jpeg",
+        ".gif",
+        ".ico",
+        ".zip",
+        ".tar",
+        ".gz",
+        ".woff",
+        ".woff2",
+        ".pdf",
+    }
+)
+MAX_REPLACE_SIZE = 8 * 1024 * 1024
+MMAP_THRESHOLD = 1024 * 1024
 
 
 class ActionBuildError(Exception):
@@ -55,17 +97,33 @@ class ActionBuildError(Exception):
     pass
 
 
-def run(cmd: list[str], env: dict[str, str] = None, cwd: Path = None) -> str:
-    """Run a shell command"""
+def run(
+    cmd: list[str],
+    env: dict[str, str] = None,
+    cwd: Path = None,
+    capture: bool = True,
+    stream: bool = False,
+    prefix: Optional[str] = None,
+) -> str:
+    """
+    Run a shell command.
+    With stream, stderr is logged line by line as it arrives, tagged with
+    prefix if given, and stdout is returned. Without capture, stdout is
+    discarded instead of buffered.
+    """
 
-    logger.debug(f"Running: {' '.join(cmd)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Running: %s", shlex.join(cmd))
+    if stream:
+        return stream_command(cmd, env=env, cwd=cwd, prefix=prefix)
     try:
         result = subprocess.run(
             cmd,
             cwd=str(cwd) if cwd else None,
             env=env,
             check=True,
-            capture_output=True,
+            stdout=subprocess.PIPE if capture else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
             text=True,
         )
         if result.stdout:
@@ -74,95 +132,247 @@ def run(cmd: list[str], env: dict[str, str] = None, cwd: Path = None) -> str:
             return result.stderr.strip()
         return ""
     except FileNotFoundError:
-        logger.error(f"Command not found: {cmd[0]}")
+        logger.error("Command not found: %s", cmd[0])
         return ""
     except subprocess.CalledProcessError as e:
-        logger.error(f"Command failed with exit code {e.returncode}")
+        logger.error("Command failed with exit code %s", e.returncode)
         if e.stderr:
             logger.error(e.stderr.strip())
         return ""
 
 
+@functools.lru_cache(maxsize=None)
+def cached_which(name: str) -> Optional[str]:
+    """Look up an executable on PATH once per process."""
+
+    return shutil.which(name)
+
+
+def tool(name: str) -> str:
+    """Resolve an executable, falling back to its bare name."""
+
+    return cached_which(name) or name
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive advisory lock on path for the duration of the block."""
+
+    with path.open("w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def stream_command(
+    cmd: list[str],
+    env: dict[str, str] = None,
+    cwd: Path = None,
+    prefix: Optional[str] = None,
+) -> str:
+    """
+    Run a command, logging its stderr live and returning its stdout.
+    Lines are tagged with prefix so interleaved parallel runs stay readable.
+    """
+
+    stdout_lines = []
+    try:
+        with subprocess.Popen(
+            cmd,
+            cwd=str(cwd) if cwd else None,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        ) as process:
+            # Drain stdout on a thread so neither pipe can fill up and block
+            reader = threading.Thread(
+                target=lambda: stdout_lines.extend(process.stdout)
+            )
+            reader.start()
+            for line in process.stderr:
+                line = line.rstrip()
+                if line:
+                    if prefix:
+                        logger.info("[%s] %s", prefix, line)
+                    else:
+                        logger.info("%s", line)
+            reader.join()
+    except FileNotFoundError:
+        logger.error("Command not found: %s", cmd[0])
+        return ""
+
+    if process.returncode != 0:
+        logger.error("Command failed with exit code %s", process.returncode)
+        return ""
+    return "".join(stdout_lines).strip()
+
+
+def remove_tree_in_background(path: Path) -> None:
+    """
+    Delete path on a separate thread so the caller can move on. The thread is
+    not a daemon, so the process (including pool workers) waits for it on exit.
+    """
+
+    threading.Thread(
+        target=shutil.rmtree, args=(path,), kwargs={"ignore_errors": True}
+    ).start()
+
+
 def ensure_exists(path: Path, what: str) -> None:
     if not path.exists():
-        logger.error(f"{what} not found: {path}")
+        logger.error("%s not found: %s", what, path)
         raise ActionBuildError(f"{what} not found: {path}")
 
 
-def copy_tree(src: Path, dst: Path) -> None:
-    if dst.exists():
-        shutil.rmtree(dst)
-    shutil.copytree(src, dst, symlinks=True)
+def copy_tree(
+    src: Path, dst: Path, replacements: Optional[list[tuple[bytes, bytes]]] = None
+) -> None:
+    """
+    Copy src to dst, substituting replacements in file contents on the way.
+    Without replacements, prefer cp --reflink=auto so filesystems that support
+    copy-on-write clone the files instead of copying their bytes.
+    """
 
+    if replacements:
+        # One alternation over all placeholders, so each file is scanned once
+        pattern = re.compile(b"|".join(re.escape(search) for search, _ in replacements))
+        shutil.copytree(
+            src,
+            dst,
+            symlinks=True,
+            copy_function=functools.partial(
+                copy_with_replacements,
+                pattern=pattern,
+                replacements=dict(replacements),
+            ),
+        )
+        return
 
-def copy_contents(src_dir: Path, dest_dir: Path) -> None:
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    for child in src_dir.iterdir():
-        target = dest_dir / child.name
-        if child.is_dir():
-            shutil.copytree(child, target, dirs_exist_ok=True, symlinks=True)
-        elif child.is_file():
-            shutil.copy2(child, target)
-        else:
-            pass  # Skip special files (e.g., fifos, sockets)
+    cp = cached_which("cp")
+    if cp:
+        result = subprocess.run(
+            [cp, "-a", "--reflink=auto", "--", str(src), str(dst)],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode == 0:
+            return
+        logger.debug("cp failed (%s), falling back to copytree", result.stderr.strip())
+        shutil.rmtree(dst, ignore_errors=True)
 
+    shutil.copytree(src, dst, symlinks=True)
 
-def replace_in_files(root: Path, search_term: str, replacement: str) -> None:
+
+def copy_with_replacements(
+    src: str, dst: str, pattern: re.Pattern[bytes], replacements: dict[bytes, bytes]
+) -> str:
     """
-    Perform a literal replacement across all regular files under root.
-    Uses binary-safe replacement to avoid encoding issues.
+    copytree copy function that replaces every match of pattern with its entry
+    in replacements while copying. Uses binary-safe replacement to avoid
+    encoding issues.
     """
 
-    search_term_b = search_term.encode("utf-8")
-    replacement_b = replacement.encode("utf-8")
+    src_path = Path(src)
+    content = None
+    if src_path.suffix.lower() not in SKIP_SUFFIXES:
+        content = read_if_contains(src_path, pattern)
+    if content is None or pattern.search(content) is None:
+        return shutil.copy2(src, dst)
 
-    for path in root.rglob("*"):
-        if not path.is_file():
-            continue
+    try:
+        new_content = pattern.sub(lambda m: replacements[m.group(0)], content)
+        # Write next to dst and rename, so an interrupted run never leaves a
+        # truncated file under the final name
+        fd, tmp_dst = tempfile.mkstemp(
+            dir=os.path.dirname(dst), prefix=".", suffix=".tmp"
+        )
         try:
-            with path.open("rb") as f:
-                content = f.read()
-            if search_term_b in content:
-                new_content = content.replace(search_term_b, replacement_b)
-                if new_content != content:
-                    with path.open("wb") as f:
-                        f.write(new_content)
-                    logger.debug(f"Replaced in: {path.relative_to(root)}")
+            with os.fdopen(fd, "wb") as f:
+                f.write(new_content)
+            shutil.copystat(src, tmp_dst)
+            os.replace(tmp_dst, dst)
         except Exception:
-            logger.exception(f"Error processing file {path}")
+            os.unlink(tmp_dst)
             raise
+    except Exception:
+        logger.exception("Error processing file %s", src)
+        raise
+    logger.debug("Replaced in: %s", dst)
+    return dst
+
+
+def copy_contents(src_dir: Path, dest_dir: Path) -> None:
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copytree(src_dir, dest_dir, dirs_exist_ok=True, symlinks=True)
 
 
-def configure_template_options(workspace_dir: Path) -> None:
+def read_if_contains(path: Path, pattern: re.Pattern[bytes]) -> Optional[bytes]:
     """
-    If devcontainer-template.json has an 'options' object, replace all
-    ${templateOption:<key>} tokens with the 'default' values.
+    Return the content of path if it may contain a match of pattern.
+    Files above MAX_REPLACE_SIZE are skipped, and large files are scanned
+    through mmap so no copy is made when there is no match.
     """
 
-    template_json = workspace_dir / "devcontainer-template.json"
+    size = path.stat().st_size
+    if size == 0 or size > MAX_REPLACE_SIZE:
+        return None
+    with path.open("rb") as f:
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if pattern.search(mm) is None:
+                    return None
+        return f.read()
+
+
+def load_template_json(template_dir: Path) -> dict:
+    """Parse the devcontainer-template.json of a template."""
+
+    template_json = template_dir / "devcontainer-template.json"
     if not template_json.exists():
-        logger.error(f"Template JSON not found: {template_json}")
+        logger.error("Template JSON not found: %s", template_json)
         raise ActionBuildError(f"Template JSON not found: {template_json}")
 
-    with template_json.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+    return json.loads(template_json.read_bytes())
+
+
+def configure_template_options(
+    template_dir: Path, data: Optional[dict] = None
+) -> list[tuple[bytes, bytes]]:
+    """
+    If devcontainer-template.json has an 'options' object, return the
+    replacements of all ${templateOption:<key>} tokens with the 'default' values.
+    Pass already parsed template JSON as data to avoid reading it again.
+    """
+
+    if data is None:
+        data = load_template_json(template_dir)
     options = data.get("options")
 
     if not options:
-        return
+        return []
     if not isinstance(options, dict) or len(options.keys()) == 0:
-        return
+        return []
 
-    logger.debug(f"Configuring template options for '{workspace_dir.name}'")
-    replace_template_placeholders(workspace_dir, options)
+    logger.debug("Configuring template options for '%s'", template_dir.name)
+    return template_option_replacements(template_dir, options)
 
 
-def replace_template_placeholders(workspace_dir, options):
-    """Replace all ${templateOption:<key>} placeholders in files under workspace_dir"""
+def template_option_replacements(
+    template_dir: Path, options: dict
+) -> list[tuple[bytes, bytes]]:
+    """
+    Build the ${templateOption:<key>} placeholder replacements for a template.
+    All options are validated before any replacement is built, so every
+    missing default is reported at once.
+    """
 
-    for option_key in options.keys():
-        placeholder = f"${{templateOption:{option_key}}}"
-        option_spec = options.get(option_key, {})
+    defaults = {}
+    missing = []
+    for option_key, option_spec in options.items():
         default_value = None
         if isinstance(option_spec, dict):
             default_value = option_spec.get("default")
@@ -170,28 +380,44 @@ def replace_template_placeholders(workspace_dir, options):
         if default_value is None or (
             isinstance(default_value, str) and default_value.strip() == ""
         ):
-            logger.error(
-                f"Template '{workspace_dir.name}' is missing a default value for option '{option_key}'"
-            )
-            raise ActionBuildError(f"Missing default for option '{option_key}'")
+            missing.append(option_key)
+        else:
+            defaults[option_key] = str(default_value)
+
+    if missing:
+        missing_keys = ", ".join(f"'{key}'" for key in missing)
+        logger.error(
+            "Template '%s' is missing a default value for option(s) %s",
+            template_dir.name,
+            missing_keys,
+        )
+        raise ActionBuildError(f"Missing default for option(s) {missing_keys}")
 
-        default_value_str = str(default_value)
-        logger.debug(f"Replacing '{placeholder}' with '{default_value_str}'")
-        replace_in_files(workspace_dir, placeholder, default_value_str)
+    replacements = []
+    for option_key, default_value_str in defaults.items():
+        placeholder = f"${{templateOption:{option_key}}}"
+        logger.debug("Replacing '%s' with '%s'", placeholder, default_value_str)
+        replacements.append(
+            (placeholder.encode("utf-8"), default_value_str.encode("utf-8"))
+        )
 
+    return replacements
 
-def prepare_workspace(workspace_root_dir: Path, template_id: str) -> Path:
+
+def prepare_workspace(
+    workspace_root_dir: Path, template_id: str, template_data: Optional[dict] = None
+) -> Path:
     """Copy the template to a temporary workspace and configure options."""
 
     source_dir = workspace_root_dir / WORKSPACE_SRC / template_id
     if not source_dir.exists():
-        logger.error(f"Source template directory not found: {source_dir}")
+        logger.error("Source template directory not found: %s", source_dir)
         raise ActionBuildError(f"Source template directory not found: {source_dir}")
 
-    workspace_dir = Path(tempfile.mkdtemp(prefix="smoke_")) / template_id
-    logger.debug(f"Preparing workspace at: {workspace_dir}")
-    copy_tree(source_dir, workspace_dir)
-    configure_template_options(workspace_dir)
+    replacements = configure_template_options(source_dir, template_data)
+    workspace_dir = Path(tempfile.mkdtemp(prefix=f"smoke_{template_id}_")) / template_id
+    logger.debug("Preparing workspace at: %s", workspace_dir)
+    copy_tree(source_dir, workspace_dir, replacements)
     return workspace_dir
 
 
@@ -210,6 +436,7 @@ def copy_test_directory(
 
     copy_contents(test_dir, dest_dir)
 
+    # Copied second so shared utils win over same-named template test files
     utils_dir = project_root / SMOKE_DIRECTORY / SMOKE_UTILS_DIRECTORY
     if utils_dir.is_dir():
         copy_contents(utils_dir, dest_dir)
@@ -218,13 +445,56 @@ def copy_test_directory(
 def ensure_devcontainers_cli(env: dict[str, str]) -> None:
     """Ensure @devcontainers/cli is installed globally via npm."""
 
+    if shutil.which("devcontainer"):
+        logger.debug("devcontainer CLI already present")
+        return
+
     logger.debug("Installing @devcontainers/cli")
-    npm = shutil.which("npm")
+    npm = cached_which("npm")
     if not npm:
         logger.error("npm is required but was not found on PATH.")
         raise ActionBuildError("npm is required but was not found on PATH.")
 
     run([npm, "install", "-g", "@devcontainers/cli"], env=env)
+    cached_which.cache_clear()
+
+
+def ensure_buildx_builder(env: dict[str, str]) -> None:
+    """Ensure the cache-capable buildx builder exists and select it via env."""
+
+    docker = tool("docker")
+    with file_lock(Path(tempfile.gettempdir()) / BUILDX_BUILDER_LOCK):
+        inspect = subprocess.run(
+            [docker, "buildx", "inspect", BUILDX_BUILDER],
+            env=env,
+            capture_output=True,
+        )
+        if inspect.returncode != 0:
+            logger.debug("Creating buildx builder: %s", BUILDX_BUILDER)
+            create = subprocess.run(
+                [
+                    docker,
+                    "buildx",
+                    "create",
+                    "--name",
+                    BUILDX_BUILDER,
+                    "--driver",
+                    "docker-container",
+                ],
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if create.returncode != 0:
+                logger.error(
+                    "Failed to create buildx builder %s: %s",
+                    BUILDX_BUILDER,
+                    create.stderr.strip(),
+                )
+                raise ActionBuildError(
+                    f"Failed to create buildx builder: {BUILDX_BUILDER}"
+                )
+    env["BUILDX_BUILDER"] = BUILDX_BUILDER
 
 
 def devcontainer_up(workspace_dir: Path, template_id: str, env: dict[str, str]) -> None:
@@ -232,24 +502,63 @@ def devcontainer_up(workspace_dir: Path, template_id: str, env: dict[str, str])
 
     logger.debug("Building Dev Container")
     id_label = f"{SMOKE_LABEL}={template_id}"
-    devcontainer = shutil.which("devcontainer") or "devcontainer"
+    devcontainer = tool("devcontainer")
 
-    dev_container_execution_status = run(
-        [
-            devcontainer,
-            "up",
-            "--id-label",
-            id_label,
-            "--workspace-folder",
-            str(workspace_dir),
-        ],
-        env=env,
-    )
-    if not dev_container_execution_status:
+    cmd = [
+        devcontainer,
+        "up",
+        "--id-label",
+        id_label,
+        "--workspace-folder",
+        str(workspace_dir),
+    ]
+    if env and env.get("SMOKE_CACHE_FROM"):
+        cmd += ["--cache-from", env["SMOKE_CACHE_FROM"]]
+    if env and env.get("SMOKE_CACHE_TO"):
+        cmd += ["--cache-to", env["SMOKE_CACHE_TO"]]
+
+    dev_container_result = run(cmd, env=env, stream=True, prefix=template_id)
+    if not dev_container_result:
         logger.error("Container failed to start")
         raise ActionBuildError("Container failed to start")
 
-    logger.debug("Container started")
+    result = parse_up_result(dev_container_result)
+    if result.get("outcome", "success") != "success":
+        logger.error("Container failed to start: %s", result)
+        raise ActionBuildError("Container failed to start")
+
+    container_id = result.get("containerId")
+    if container_id:
+        # Kept in the per-run temp dir, outside the workspace mounted in the container
+        (workspace_dir.parent / SMOKE_CONTAINER_ID_FILE).write_text(container_id)
+    else:
+        logger.debug("No container ID in devcontainer up output, cleanup uses labels")
+    logger.debug("Container started: %s", container_id)
+
+
+def parse_up_result(output: str) -> dict:
+    """
+    Return the last JSON object printed by devcontainer up, e.g.
+    {"outcome": "success", "containerId": "...", ...}, or {} if there is none.
+    """
+
+    for line in reversed(output.splitlines()):
+        try:
+            result = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(result, dict):
+            return result
+    return {}
+
+
+def positive_int(value: str) -> int:
+    """argparse type for integers of at least 1."""
+
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
 
 def parse_args() -> argparse.Namespace:
@@ -263,44 +572,103 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument(
         "template_id",
-        help="Template identifier (directory under src/)",
+        help="Template identifier(s) (directories under src/)",
+        nargs="+",
     )
     parser.add_argument(
         "-t",
         "--tmpdir",
-        help="Optional temp directory (defaults to system temp dir)",
+        help="Workspace directory from the build action (repeat once per template, in order)",
+        action="append",
+        default=None,
+    )
+    parser.add_argument(
+        "-p",
+        "--parallel",
+        help="Number of templates to process concurrently (defaults to CPU count minus two)",
+        type=positive_int,
         default=None,
     )
+    parser.add_argument(
+        "--skip-cli-install",
+        help="Assume @devcontainers/cli is already installed (e.g. baked into the CI image)",
+        action="store_true",
+    )
     return parser.parse_args()
 
 
-def cleanup_docker_containers(template_id: str) -> None:
+def list_labelled_containers(template_id: str) -> list[str]:
+    """List the IDs of all containers carrying the smoke label for template_id."""
+
     container_ids = run(
-        ["docker", "ps", "-a", "-q", "--filter", f"label={SMOKE_LABEL}={template_id}"]
+        [
+            tool("docker"),
+            "ps",
+            "-a",
+            "-q",
+            "--filter",
+            f"label={SMOKE_LABEL}={template_id}",
+        ]
+    )
+    return container_ids.splitlines()
+
+
+def cleanup_docker_containers(
+    template_id: str, workspace_dir: Optional[Path] = None
+) -> None:
+    """
+    Remove the containers started for template_id. Uses the container ID
+    recorded by devcontainer_up when available, otherwise queries docker
+    for containers carrying the smoke label.
+    """
+
+    container_id_file = (
+        workspace_dir.parent / SMOKE_CONTAINER_ID_FILE if workspace_dir else None
     )
-    if not container_ids:
-        logger.debug(f"No containers found with label {SMOKE_LABEL}={template_id}")
+    if container_id_file and container_id_file.is_file():
+        container_id_list = container_id_file.read_text().split()
+        container_id_file.unlink(missing_ok=True)
+        logger.debug("Using recorded container ID from %s", container_id_file)
+    else:
+        container_id_list = list_labelled_containers(template_id)
+    if not container_id_list:
+        logger.debug("No containers found with label %s=%s", SMOKE_LABEL, template_id)
         return
-    container_id_list = container_ids.splitlines()
 
-    logger.debug(f"Removing containers: {' '.join(container_id_list)}")
-    removed_ids_status = run(["docker", "rm", "-f", *container_id_list])
-    logger.debug(f"Removed containers execution status: {removed_ids_status}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Removing containers: %s", " ".join(container_id_list))
+    # The daemon removes the IDs of a single 'docker rm' one after another,
+    # so issue one request per container and let it handle them concurrently
+    docker = tool("docker")
+    workers = min(MAX_CONTAINER_REMOVALS, len(container_id_list))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run, [docker, "rm", "-f", container_id], capture=False)
+            for container_id in container_id_list
+        ]
+        for future in futures:
+            future.result()
+    logger.debug("Removed containers")
 
 
 def exec_build_action(
-    workspace_root_dir: Path, template_id: str, env: dict[str, str]
+    workspace_root_dir: Path,
+    template_id: str,
+    env: dict[str, str],
+    install_cli: bool = True,
 ) -> None:
     workspace_dir = prepare_workspace(workspace_root_dir, template_id)
     copy_test_directory(workspace_root_dir, template_id, workspace_dir)
-    ensure_devcontainers_cli(env)
+    if install_cli:
+        with file_lock(Path(tempfile.gettempdir()) / DEVCONTAINERS_CLI_LOCK):
+            ensure_devcontainers_cli(env)
     devcontainer_up(workspace_dir, template_id, env)
 
     return workspace_dir
 
 
 def exec_test_action(workspace_dir: str, template_id: str) -> None:
-    devcontainer = shutil.which("devcontainer") or "devcontainer"
+    devcontainer = tool("devcontainer")
 
     cmd = [
         devcontainer,
@@ -314,7 +682,8 @@ def exec_test_action(workspace_dir: str, template_id: str) -> None:
         f"if [ -f {SMOKE_DIRECTORY}/{SMOKE_FILE} ]; then chmod +x {SMOKE_DIRECTORY}/{SMOKE_FILE} && {SMOKE_DIRECTORY}/{SMOKE_FILE}; else echo 'No tests to run'; fi",
     ]
 
-    logger.debug(f"Running: {' '.join(cmd)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Running: %s", shlex.join(cmd))
     try:
         result = subprocess.run(
             cmd,
@@ -328,7 +697,7 @@ def exec_test_action(workspace_dir: str, template_id: str) -> None:
 
     except subprocess.CalledProcessError as e:
         logger.error("Tests failed inside the Dev Container")
-        logger.error(f"Exit code: {e.returncode}")
+        logger.error("Exit code: %s", e.returncode)
         if e.stdout:
             logger.error("STDOUT:")
             logger.error(e.stdout)
@@ -337,42 +706,54 @@ def exec_test_action(workspace_dir: str, template_id: str) -> None:
             logger.error(e.stderr)
         raise ActionBuildError(f"Tests failed inside the Dev Container with exit code {e.returncode}")
     except FileNotFoundError:
-        logger.error(f"Command not found: {cmd[0]}")
+        logger.error("Command not found: %s", cmd[0])
         raise ActionBuildError(f"Command not found: {cmd[0]}")
 
-    cleanup_docker_containers(template_id)
+    cleanup_docker_containers(template_id, Path(workspace_dir))
 
     logger.debug("Cleaning up workspace directory")
-    shutil.rmtree(workspace_dir, ignore_errors=True)
+    remove_tree_in_background(Path(workspace_dir))
 
     logger.debug("Test completed")
 
 
-def start_action(action: str, template_id: str, tmpdir: Optional[str] = None) -> None:
+def start_action(
+    action: str,
+    template_id: str,
+    tmpdir: Optional[str] = None,
+    install_cli: bool = True,
+) -> None:
     """Return the action definition for the given action."""
     if action == "build":
-        logger.debug(f"Building template: {template_id}")
+        logger.debug("Building template: %s", template_id)
         workspace_root_dir = Path.cwd()
         env = os.environ.copy()
         env["DOCKER_BUILDKIT"] = "1"
+        if env.get("SMOKE_CACHE_FROM") or env.get("SMOKE_CACHE_TO"):
+            ensure_buildx_builder(env)
 
-        workspace_dir = exec_build_action(workspace_root_dir, template_id, env)
+        workspace_dir = exec_build_action(
+            workspace_root_dir, template_id, env, install_cli
+        )
 
         gha_output = os.getenv("GITHUB_OUTPUT")
         if gha_output:
             try:
-                logger.debug(f"Writing workspace path to GITHUB_OUTPUT: {gha_output}")
+                logger.debug("Writing workspace path to GITHUB_OUTPUT: %s", gha_output)
                 with open(gha_output, "a", encoding="utf-8") as f:
-                    f.write(f"workspace={workspace_dir}\n")
+                    f.write(
+                        f"workspace={workspace_dir}\n"
+                        f"workspace-{template_id}={workspace_dir}\n"
+                    )
             except Exception:
-                logger.exception(f"Error writing to GITHUB_OUTPUT: {gha_output}")
+                logger.exception("Error writing to GITHUB_OUTPUT: %s", gha_output)
                 raise ActionBuildError(f"Error writing to GITHUB_OUTPUT: {gha_output}")
         else:
             logger.debug("GITHUB_OUTPUT not set")
             print(workspace_dir)
 
     if action == "test":
-        logger.debug(f"Testing template: {template_id}")
+        logger.debug("Testing template: %s", template_id)
         if not tmpdir:
             logger.error("The --tmpdir argument is required for 'test' action")
             raise ActionBuildError(
@@ -382,14 +763,88 @@ def start_action(action: str, template_id: str, tmpdir: Optional[str] = None) ->
         exec_test_action(workspace_dir, template_id)
 
 
+def default_parallelism() -> int:
+    """Leave two cores for Docker and the rest of the host."""
+
+    return max((os.cpu_count() or 1) - 2, 1)
+
+
+def start_actions(
+    action: str,
+    template_ids: list[str],
+    tmpdirs: list[Optional[str]],
+    parallel: Optional[int] = None,
+    install_cli: bool = True,
+) -> None:
+    """
+    Run the action for each template, sharded across worker processes.
+    Every template runs even if others fail; failures are raised together.
+    """
+
+    jobs = list(zip(template_ids, tmpdirs))
+    if parallel is None:
+        parallel = default_parallelism()
+    workers = min(parallel, len(jobs))
+    failed = []
+    if workers == 1:
+        for template_id, tmpdir in jobs:
+            try:
+                start_action(action, template_id, tmpdir, install_cli)
+            except Exception:
+                logger.exception(
+                    "Action '%s' failed for template: %s", action, template_id
+                )
+                failed.append(template_id)
+        raise_failed_templates(action, failed)
+        return
+
+    logger.debug(
+        "Running '%s' for %s templates on %s workers", action, len(jobs), workers
+    )
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                start_action, action, template_id, tmpdir, install_cli
+            ): template_id
+            for template_id, tmpdir in jobs
+        }
+        for future in as_completed(futures):
+            template_id = futures[future]
+            try:
+                future.result()
+            except Exception:
+                logger.exception(
+                    "Action '%s' failed for template: %s", action, template_id
+                )
+                failed.append(template_id)
+
+    raise_failed_templates(action, failed)
+
+
+def raise_failed_templates(action: str, failed: list[str]) -> None:
+    if failed:
+        raise ActionBuildError(
+            f"Action '{action}' failed for templates: {', '.join(sorted(failed))}"
+        )
+
+
 def main() -> None:
     args = parse_args()
-    logger.debug(f"Args: {args}")
+    logger.debug("Args: %s", args)
     try:
         action = args.action
-        template_id = args.template_id
-        tmpdir = args.tmpdir
-        start_action(action, template_id, tmpdir)
+        template_ids = args.template_id
+        tmpdirs = args.tmpdir or [None] * len(template_ids)
+        if len(tmpdirs) != len(template_ids):
+            logger.error("The --tmpdir argument must be given once per template")
+            raise ActionBuildError("The --tmpdir argument must be given once per template")
+        start_actions(
+            action,
+            template_ids,
+            tmpdirs,
+            args.parallel,
+            install_cli=not args.skip_cli_install,
+        )
     except ActionBuildError:
         logger.exception("Action failed")
         exit(1)